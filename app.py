@@ -1,7 +1,6 @@
 from flask import Flask, render_template
 from flask_socketio import SocketIO, emit
 import random
-import json
 import threading
 from peers import Peer
 
@@ -40,9 +39,7 @@ def handle_list_files():
 @socketio.on("list_peers")
 def handle_list_peers():
     """Solicita a lista de peers conectados ao tracker."""
-    peer.tracker_conn.sendall(json.dumps({"command": "LIST"}).encode())
-    response = peer.tracker_conn.recv(1024).decode()
-    peers = json.loads(response).get("peers", {})
+    peers = peer.request_tracker({"command": "LIST"}).get("peers", {})
     peer.discover_and_connect_peers()
     emit("peer_list", peers)
 
@@ -0,0 +1,53 @@
+"""
+Mede quantas threads o peer usa conforme o número de conexões cresce.
+
+Uso: python bench_connections.py [conexões ...]
+
+Para cada quantidade de conexões, abre os sockets contra um peer local, faz um
+LIST_FILES em cada um e imprime o número de threads ativas no processo.
+"""
+import json
+import socket
+import sys
+import threading
+import time
+
+from peers import Peer
+from protocol import MessageBuffer, recv_message
+
+PEER_HOST = "127.0.0.1"
+PEER_PORT = 6999
+
+
+def open_connections(count):
+    conns = []
+    for _ in range(count):
+        conn = socket.create_connection((PEER_HOST, PEER_PORT))
+        conns.append(conn)
+    for conn in conns:
+        conn.sendall(json.dumps({"command": "LIST_FILES"}).encode())
+    for conn in conns:
+        recv_message(conn, MessageBuffer())
+    return conns
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 500]
+
+    peer = Peer(PEER_HOST, PEER_PORT, max_connections=max(counts) + 1)
+    peer.add_file(__file__)
+    peer.start()
+
+    print(f"{'conexões':>10} {'threads':>8} {'tempo (s)':>10}")
+    for count in counts:
+        start = time.perf_counter()
+        conns = open_connections(count)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>10} {threading.active_count():>8} {elapsed:>10.3f}")
+        for conn in conns:
+            conn.close()
+        time.sleep(0.2)  # Deixa o loop processar o encerramento das conexões
+
+
+if __name__ == "__main__":
+    main()
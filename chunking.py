@@ -0,0 +1,97 @@
+import hashlib
+import random
+
+# Tamanhos dos chunks, em bytes. A média é dada pela quantidade de bits da máscara.
+MIN_CHUNK_SIZE = 2 * 1024
+AVG_CHUNK_SIZE = 8 * 1024
+MAX_CHUNK_SIZE = 64 * 1024
+
+READ_SIZE = 1024 * 1024
+
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# Tabela do Gear hash: um valor pseudoaleatório fixo por byte. A semente é fixa para que
+# todos os peers cortem os mesmos arquivos nos mesmos pontos.
+_rng = random.Random(0x5EED)
+_GEAR = [_rng.getrandbits(_HASH_BITS) for _ in range(256)]
+del _rng
+
+
+def _boundary_mask(avg_size):
+    # Usa os bits mais altos do hash, que dependem de uma janela maior de bytes
+    bits = avg_size.bit_length() - 1
+    return ((1 << bits) - 1) << (_HASH_BITS - bits)
+
+
+def find_boundary(data, start, eof, min_size=MIN_CHUNK_SIZE, avg_size=AVG_CHUNK_SIZE, max_size=MAX_CHUNK_SIZE):
+    """
+    Procura o fim do chunk que começa em data[start].
+
+    Um corte acontece quando o Gear hash rolante dos últimos bytes tem os bits da máscara
+    zerados, de modo que os pontos de corte dependem apenas do conteúdo: inserir ou remover
+    bytes em um trecho do arquivo só muda os chunks vizinhos à alteração.
+
+    Args:
+        data (bytes): Os dados disponíveis.
+        start (int): Início do chunk.
+        eof (bool): True se não há mais dados depois de `data`.
+
+    Returns:
+        int | None: O índice logo após o fim do chunk, ou None se são necessários mais dados.
+    """
+    available = len(data) - start
+    if available <= 0:
+        return None
+    if available <= min_size:
+        return len(data) if eof else None
+
+    mask = _boundary_mask(avg_size)
+    limit = min(len(data), start + max_size)
+    gear = _GEAR
+    h = 0
+    for i in range(start + min_size, limit):
+        h = ((h << 1) + gear[data[i]]) & _HASH_MASK
+        if not h & mask:
+            return i + 1
+
+    if limit == start + max_size or eof:
+        return limit
+    return None
+
+
+def iter_chunks(f):
+    """Gera os chunks (bytes) de um arquivo aberto em modo binário."""
+    buffer = b""
+    while True:
+        block = f.read(READ_SIZE)
+        eof = not block
+        buffer += block
+
+        start = 0
+        while True:
+            end = find_boundary(buffer, start, eof)
+            if end is None:
+                break
+            yield buffer[start:end]
+            start = end
+        buffer = buffer[start:]
+
+        if eof:
+            return
+
+
+def chunk_digest(chunk):
+    """Identificador de um chunk: o SHA-256 do seu conteúdo."""
+    return hashlib.sha256(chunk).hexdigest()
+
+
+def chunk_file(file_path):
+    """
+    Calcula o manifesto de chunks de um arquivo.
+
+    Returns:
+        list: Lista de {"hash": str, "size": int}, na ordem em que os chunks aparecem no arquivo.
+    """
+    with open(file_path, "rb") as f:
+        return [{"hash": chunk_digest(chunk), "size": len(chunk)} for chunk in iter_chunks(f)]
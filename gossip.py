@@ -0,0 +1,117 @@
+import random
+import uuid
+from collections import OrderedDict
+
+
+class GossipRouter:
+    """
+    Espalha mensagens de broadcast e de grupo pela rede overlay de peers.
+
+    Cada mensagem nova é entregue localmente (se for um broadcast ou de um grupo do qual
+    o peer participa) e repassada aos vizinhos com o TTL decrementado. Mensagens já vistas
+    são descartadas usando um cache limitado de IDs. Os repasses para um mesmo vizinho são
+    acumulados por `batch_window` segundos e enviados juntos em um único quadro.
+
+    O roteador não conhece sockets: quem o usa fornece as funções de envio e de agendamento,
+    o que permite usá-lo tanto no peer quanto em simulações.
+    """
+
+    def __init__(self, peer_id, send, schedule, deliver, ttl=8, fanout=None,
+                 seen_capacity=4096, batch_window=0.01, batch_size=32):
+        """
+        Args:
+            peer_id (str): Identificador deste peer.
+            send (callable): send(neighbor, messages) envia uma lista de mensagens a um vizinho.
+            schedule (callable): schedule(delay, callback, *args) agenda uma chamada futura.
+            deliver (callable): deliver(message) é chamada para cada mensagem entregue a este peer.
+            ttl (int): Número máximo de saltos de uma mensagem.
+            fanout (int | None): Quantos vizinhos recebem cada repasse; None repassa a todos.
+            seen_capacity (int): Quantidade de IDs lembrados para descartar duplicatas.
+            batch_window (float): Tempo, em segundos, que um repasse espera por outros ao mesmo vizinho.
+            batch_size (int): Tamanho do lote que é enviado imediatamente, sem esperar a janela.
+        """
+        self.peer_id = peer_id
+        self.send = send
+        self.schedule = schedule
+        self.deliver = deliver
+        self.ttl = ttl
+        self.fanout = fanout
+        self.seen_capacity = seen_capacity
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+
+        self.groups = set()  # Grupos dos quais este peer participa
+        self.seen = OrderedDict()  # {message_id: None}, do mais antigo para o mais recente
+        self.pending = {}  # {neighbor: [message]} aguardando o fim da janela de lote
+        self.stats = {"published": 0, "received": 0, "duplicates": 0, "delivered": 0, "forwarded": 0, "frames": 0}
+
+    def publish(self, text, neighbors, group=None):
+        """
+        Cria uma mensagem de broadcast (ou do grupo `group`) e a envia aos vizinhos.
+
+        Returns:
+            dict: A mensagem publicada.
+        """
+        message = {
+            "id": uuid.uuid4().hex,
+            "origin": self.peer_id,
+            "ttl": self.ttl,
+            "group": group,
+            "message": text,
+        }
+        self._remember(message["id"])
+        self.stats["published"] += 1
+        self._forward(message, neighbors, exclude=None)
+        return message
+
+    def receive(self, messages, sender, neighbors):
+        """
+        Processa as mensagens recebidas de um vizinho.
+
+        Args:
+            messages (list): Mensagens de um quadro de gossip.
+            sender: O vizinho que enviou o quadro; não recebe os repasses de volta.
+            neighbors (iterable): Os vizinhos atuais deste peer.
+        """
+        neighbors = list(neighbors)
+        for message in messages:
+            self.stats["received"] += 1
+            if message["id"] in self.seen:
+                self.stats["duplicates"] += 1
+                self.seen.move_to_end(message["id"])
+                continue
+
+            self._remember(message["id"])
+            group = message.get("group")
+            if group is None or group in self.groups:
+                self.stats["delivered"] += 1
+                self.deliver(message)
+
+            if message["ttl"] > 1:
+                self._forward(dict(message, ttl=message["ttl"] - 1), neighbors, exclude=sender)
+
+    def flush(self, neighbor):
+        """Envia ao vizinho todas as mensagens acumuladas para ele."""
+        messages = self.pending.pop(neighbor, None)
+        if messages:
+            self.stats["frames"] += 1
+            self.send(neighbor, messages)
+
+    def _forward(self, message, neighbors, exclude):
+        targets = [n for n in neighbors if n != exclude and n != message["origin"]]
+        if self.fanout is not None and len(targets) > self.fanout:
+            targets = random.sample(targets, self.fanout)
+
+        for neighbor in targets:
+            self.stats["forwarded"] += 1
+            queue = self.pending.setdefault(neighbor, [])
+            queue.append(message)
+            if len(queue) >= self.batch_size:
+                self.flush(neighbor)
+            elif len(queue) == 1:
+                self.schedule(self.batch_window, self.flush, neighbor)
+
+    def _remember(self, message_id):
+        self.seen[message_id] = None
+        if len(self.seen) > self.seen_capacity:
+            self.seen.popitem(last=False)
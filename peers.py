@@ -1,20 +1,118 @@
 import socket
+import selectors
 import threading
+import errno
+import heapq
+import itertools
 import json
 import os
 import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from chunking import chunk_digest, chunk_file
+from gossip import GossipRouter
+from protocol import MessageBuffer, recv_exact, recv_message
+
+
+def _file_key(file_path):
+    """Identifica uma versão do arquivo pela data de modificação e tamanho; None se não puder ser lido."""
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class PeerConnection:
+    """Estado de uma conexão atendida pelo loop de eventos do peer."""
+
+    def __init__(self, conn, peer_id=None, address=None):
+        self.conn = conn
+        self.peer_id = peer_id
+        self.address = address
+        self.buffer = MessageBuffer()  # Bytes recebidos ainda não processados
+        self.outbox = bytearray()  # Bytes aguardando envio
+        self.attached = False  # True enquanto o socket está registrado no seletor
+        self.connecting = None  # Future da conexão de saída ainda em andamento
+        self.closed = False
+
 
 class Peer:
-    def __init__(self, host, port):
+    def __init__(self, host, port, max_connections=512, max_uploads=4, announce_window=0.05, chunking=False):
+        """
+        Inicializa o peer.
+
+        Args:
+            host (str): Endereço em que o peer escuta conexões.
+            port (int): Porta em que o peer escuta conexões.
+            max_connections (int): Número máximo de conexões abertas ao mesmo tempo. Ao atingir
+                o limite o peer deixa de aceitar novas conexões até que alguma seja encerrada.
+            max_uploads (int): Número de uploads simultâneos. Pedidos excedentes aguardam na fila
+                sem que a conexão seja lida, o que segura o cliente pelo próprio TCP.
+            announce_window (float): Intervalo, em segundos, em que os anúncios de arquivos ao
+                tracker são acumulados antes de serem enviados em um único BATCH.
+            chunking (bool): Ativa o modo de chunks: cada arquivo compartilhado é dividido em
+                chunks definidos pelo conteúdo e passa a anunciar um manifesto, permitindo que
+                outros peers baixem apenas os chunks que ainda não têm (`request_file_delta`).
+
+        Todo o tráfego de controle (chat, listagens, pedidos de conexão) é atendido por uma única
+        thread com `selectors`; apenas a leitura de disco dos uploads roda no pool de threads.
+        """
         self.host = host
         self.port = port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.tracker_conn = None
         self.tracker_host = None
         self.tracker_port = None
+        self.tracker_lock = threading.RLock()  # Uma requisição ao tracker por vez
+        self.tracker_buffer = MessageBuffer()
         self.connected_peers = {}  # {peer_id: connection}
         self.files = {}  # Arquivos disponíveis para compartilhamento
 
+        self.announce_window = announce_window
+        self.announce_lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.announce_timer = None
+        self.pending_announcements = {}  # {filename: "ADD_FILE" | "REMOVE_FILE"} ainda não enviados
+        self.announced_files = set()  # Arquivos que o tracker já conhece
+
+        self.chunking = chunking
+        self.chunk_lock = threading.Lock()
+        # Uma thread calcula em segundo plano os manifestos dos arquivos adicionados
+        self.index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chunk-index") if chunking else None
+        self.manifests = {}  # {filename: ((mtime_ns, size), manifest)}
+        self.chunk_index = {}  # {hash: (file_path, offset, size, (mtime_ns, size))}, um local por chunk do catálogo
+
+        self.max_connections = max_connections
+        self.max_uploads = max_uploads
+        self.selector = selectors.DefaultSelector()
+        self.upload_pool = ThreadPoolExecutor(max_workers=max_uploads, thread_name_prefix="upload")
+        self.connections = {}  # {socket: PeerConnection}
+        self.neighbors = {}  # {peer_id: PeerConnection} vizinhos do overlay de gossip
+        self.active_uploads = 0
+        self.waiting_uploads = deque()  # [(PeerConnection, bytes pendentes, job, args)] aguardando vaga no pool
+        self.listening = False
+        self.accepting = False
+        self.loop_thread = None
+        self.loop_lock = threading.Lock()
+        self.pending_calls = deque()  # [(callback, args)] a executar na thread do loop
+        self.timers = []  # heap [(quando, seq, callback, args)] agendados com call_later
+        self.timer_seq = itertools.count()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ, self._drain_wakeup)
+
+        # Broadcast e grupos por gossip; o roteador só é usado na thread do loop
+        self.gossip = GossipRouter(
+            f"{host}:{port}",
+            send=self._send_gossip,
+            schedule=self.call_later,
+            deliver=self._deliver_gossip,
+        )
+
     def list_connected_peers(self):
         """Lista os peers atualmente conectados."""
         if self.connected_peers:
@@ -47,9 +145,10 @@ class Peer:
             "port": self.port,
         }
         try:
-            self.tracker_conn.sendall(json.dumps(message).encode())
-            response = self.tracker_conn.recv(1024).decode()
-            data = json.loads(response)
+            with self.tracker_lock:
+                data = self.request_tracker(message)
+                if data.get("status") == "success":
+                    self._tracker_recv()  # O tracker envia a lista de peers logo após o registro
             if data.get("status") == "success":
                 print("Registrado com sucesso no tracker.")
             else:
@@ -65,9 +164,7 @@ class Peer:
             return
 
         try:
-            self.tracker_conn.sendall(json.dumps({"command": "LIST"}).encode())
-            response = self.tracker_conn.recv(1024).decode()
-            data = json.loads(response)
+            data = self.request_tracker({"command": "LIST"})
 
             if data.get("status") == "success":
                 peers = data.get("peers", {})
@@ -81,18 +178,16 @@ class Peer:
 
     def search_file(self, filename):
         """Busca um arquivo entre os peers conectados e lista quais possuem o arquivo."""
-        
+
         if not self.tracker_conn:
             print("[ERRO] Não está conectado ao tracker.")
             return
-        
+
         peers_with_file = []
 
         try:
             # Pede a lista de peers ao tracker
-            self.tracker_conn.sendall(json.dumps({"command": "LIST"}).encode())
-            response = self.tracker_conn.recv(1024).decode()
-            data = json.loads(response)
+            data = self.request_tracker({"command": "LIST"})
 
             if data.get("status") == "success":
                 peers = data.get("peers", {})
@@ -122,9 +217,12 @@ class Peer:
             # Envia a solicitação de busca de arquivo
             conn.sendall(json.dumps({"command": "LIST_FILES"}).encode())
 
-            # Recebe a resposta e verifica se o arquivo está disponível
-            response = conn.recv(1024).decode()
-            data = json.loads(response)
+            # Recebe a resposta e verifica se o arquivo está disponível; mensagens com
+            # "command" não são respostas e são ignoradas
+            buffer = MessageBuffer()
+            data = recv_message(conn, buffer) or {}
+            while "command" in data:
+                data = recv_message(conn, buffer) or {}
 
             conn.close()
 
@@ -138,17 +236,23 @@ class Peer:
 
 
     def connect_to_peer(self, peer_id, peer_host, peer_port):
-        """Estabelece uma conexão com outro peer e mantém a conexão aberta."""
-        try:
-            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            conn.connect((peer_host, int(peer_port)))
-            self.connected_peers[peer_id] = conn
-            print(f"Conectado ao peer {peer_id} em {peer_host}:{peer_port}")
+        """
+        Estabelece uma conexão com outro peer e mantém a conexão aberta.
+
+        A conexão é feita de forma não bloqueante pelo loop de eventos. Chamado de outra
+        thread, aguarda o resultado e retorna True se a conexão foi estabelecida; chamado
+        de dentro do loop (pedido CONNECT do tracker), apenas agenda a conexão.
+        """
+        future = Future()
+        self.call_soon(self._open_connection, peer_id, peer_host, int(peer_port), future)
+        if threading.current_thread() is self.loop_thread:
+            return None
 
-            # Criar uma thread para ouvir mensagens desse peer
-            threading.Thread(target=self.handle_message, args=(conn,), daemon=True).start()
+        try:
+            return future.result(timeout=10)
         except Exception as e:
             print(f"Erro ao conectar ao peer {peer_id}: {e}")
+            return False
 
 
 
@@ -156,16 +260,32 @@ class Peer:
         """Envia uma mensagem de chat para um peer específico."""
 
         if recipient_id in self.connected_peers:
-            try:
-                payload = {"command": "CHAT", "message": message}
-                conn = self.connected_peers[recipient_id]
-                conn.sendall(json.dumps(payload).encode())
-                print(f"Mensagem enviada para {recipient_id}: {message}")
-            except Exception as e:
-                print(f"Erro ao enviar mensagem para {recipient_id}: {e}")
+            payload = {"command": "CHAT", "message": message}
+            self.call_soon(self._send_to_peer, recipient_id, payload)
+            print(f"Mensagem enviada para {recipient_id}: {message}")
         else:
             print(f"Peer {recipient_id} não está conectado.")
 
+    def broadcast_message(self, message):
+        """Envia uma mensagem de chat para todos os peers da rede, repassada de vizinho em vizinho (gossip)."""
+        self.call_soon(self._publish_gossip, message, None)
+        print(f"Mensagem enviada para todos: {message}")
+
+    def join_group(self, group):
+        """Passa a receber as mensagens enviadas ao grupo."""
+        self.call_soon(self.gossip.groups.add, group)
+        print(f"Entrou no grupo '{group}'.")
+
+    def leave_group(self, group):
+        """Deixa de receber as mensagens do grupo (o peer continua repassando-as)."""
+        self.call_soon(self.gossip.groups.discard, group)
+        print(f"Saiu do grupo '{group}'.")
+
+    def send_group_message(self, group, message):
+        """Envia uma mensagem de chat aos membros de um grupo, por gossip."""
+        self.call_soon(self._publish_gossip, message, group)
+        print(f"Mensagem enviada para o grupo '{group}': {message}")
+
 
     def add_file(self, file_path):
         """Adiciona um arquivo ao peer para compartilhamento."""
@@ -175,49 +295,229 @@ class Peer:
             print(f"Erro: O arquivo '{file_path}' não existe.")
             return
 
+        if not os.path.isfile(file_path) or not os.access(file_path, os.R_OK):
+            print(f"Erro: '{file_path}' não é um arquivo legível.")
+            return
+
         filename = os.path.basename(file_path)  # Obtém o nome do arquivo
         self.files[filename] = file_path  # Armazena o caminho do arquivo
+        self._index_later(filename)
+        self.announce_file("ADD_FILE", filename)
         print(f"Arquivo '{filename}' adicionado ao peer para compartilhamento.")
 
+    def remove_file(self, filename):
+        """Deixa de compartilhar um arquivo."""
+        if self.files.pop(filename, None) is None:
+            print(f"Erro: O arquivo '{filename}' não está sendo compartilhado.")
+            return
 
+        if self.chunking:
+            with self.chunk_lock:
+                self.manifests.pop(filename, None)
+                self._rebuild_chunk_index()
 
-    def request_file(self, peer_id, filename, save_path):
-        """Solicita o download de um arquivo de outro peer."""
-        if peer_id in self.connected_peers:
-            try:
-                conn = self.connected_peers[peer_id]
-                request = {"command": "DOWNLOAD", "filename": filename}
-                conn.sendall(json.dumps(request).encode())
+        self.announce_file("REMOVE_FILE", filename)
+        print(f"Arquivo '{filename}' removido do compartilhamento.")
 
-                # Primeiro, recebe e interpreta a resposta JSON com o tamanho do arquivo
-                response = conn.recv(1024).decode()
-                if not response:
-                    print("Erro: Resposta vazia recebida.")
-                    return
+    def share_directory(self, directory):
+        """Compartilha todos os arquivos de um diretório; o tracker recebe um único anúncio em lote."""
+        if not os.path.isdir(directory):
+            print(f"Erro: O diretório '{directory}' não existe.")
+            return
 
-                try:
-                    data = json.loads(response)
-                except json.JSONDecodeError:
-                    print("Erro: Resposta inválida recebida (não é JSON).")
+        count = 0
+        skipped = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if not os.access(entry.path, os.R_OK):
+                    skipped += 1
+                    continue
+                self.files[entry.name] = entry.path
+                self._index_later(entry.name)
+                self.announce_file("ADD_FILE", entry.name)
+                count += 1
+        print(f"{count} arquivo(s) de '{directory}' adicionados ao peer para compartilhamento.")
+        if skipped:
+            print(f"{skipped} arquivo(s) sem permissão de leitura foram ignorados.")
+
+    def announce_file(self, command, filename):
+        """
+        Enfileira um anúncio de arquivo (ADD_FILE ou REMOVE_FILE) para o tracker.
+
+        Os anúncios feitos dentro de `announce_window` são combinados: cada arquivo guarda
+        apenas a mudança líquida em relação ao que o tracker já conhece ou está recebendo
+        (adicionar e remover o mesmo arquivo se anulam) e tudo é enviado em um único BATCH.
+        """
+        if not self.tracker_conn:
+            return
+
+        with self.announce_lock:
+            known = filename in self.announced_files
+            if (command == "ADD_FILE") == known:
+                self.pending_announcements.pop(filename, None)
+            else:
+                self.pending_announcements[filename] = command
+            self._schedule_flush(self.announce_window)
+
+    def _schedule_flush(self, delay):
+        # Chamado com announce_lock
+        if self.pending_announcements and self.announce_timer is None:
+            self.announce_timer = threading.Timer(delay, self.flush_announcements)
+            self.announce_timer.daemon = True
+            self.announce_timer.start()
+
+    def flush_announcements(self):
+        """Envia imediatamente os anúncios de arquivos pendentes em um único BATCH."""
+        with self.flush_lock:  # Um lote por vez, para que os anúncios cheguem na ordem
+            with self.announce_lock:
+                if self.announce_timer is not None:
+                    self.announce_timer.cancel()
+                    self.announce_timer = None
+                pending, self.pending_announcements = self.pending_announcements, {}
+                # `announced_files` passa a incluir o que está em trânsito; anúncios feitos
+                # durante o envio são combinados com esse estado
+                self._apply_announcements(pending)
+
+            if not pending:
+                return
+
+            peer_id = f"{self.host}:{self.port}"
+            operations = [
+                {"command": command, "peer_id": peer_id, "filename": filename}
+                for filename, command in pending.items()
+            ]
+            try:
+                data = self.batch_tracker(operations)
+            except Exception as e:
+                print(f"Erro ao anunciar arquivos ao tracker: {e}")
+                self._restore_announcements(pending, retry_delay=max(self.announce_window, 1.0))
+                return
+
+            if data.get("status") != "success":
+                print("Erro ao anunciar arquivos ao tracker:", data.get("message"))
+                failed = data.get("failed")
+                if not isinstance(failed, list):
+                    self._restore_announcements(pending, retry_delay=None)
                     return
+                # O lote é tudo ou nada: descarta as operações recusadas e reenvia as demais
+                rejected = {
+                    operations[i]["filename"] for i in failed
+                    if isinstance(i, int) and 0 <= i < len(operations)
+                }
+                self._restore_announcements(pending, retry_delay=self.announce_window, rejected=rejected)
+
+    def _apply_announcements(self, pending):
+        # Chamado com announce_lock
+        for filename, command in pending.items():
+            if command == "ADD_FILE":
+                self.announced_files.add(filename)
+            else:
+                self.announced_files.discard(filename)
+
+    def _restore_announcements(self, pending, retry_delay, rejected=()):
+        """
+        Desfaz um lote que o tracker não aplicou e devolve seus anúncios à fila.
+
+        Para cada arquivo, o estado desejado é o do anúncio mais recente (feito durante o envio,
+        se houver, ou o do próprio lote); a fila volta a guardar a diferença entre esse estado
+        e o que o tracker de fato conhece. As operações em `rejected` foram recusadas pelo
+        tracker, que portanto não lista o arquivo para este peer (um REMOVE_FILE de um arquivo
+        que ele já não tinha ou um ADD_FILE inválido); elas não voltam à fila, para não fazer
+        todos os lotes seguintes serem recusados também.
+
+        Args:
+            pending (dict): O lote enviado, {filename: command}.
+            retry_delay (float | None): Após quanto tempo reenviar a fila; None espera o próximo
+                anúncio ou `flush_announcements`.
+            rejected (set): Arquivos cujas operações o tracker recusou.
+        """
+        with self.announce_lock:
+            for filename, command in pending.items():
+                newer = self.pending_announcements.get(filename)
+                if filename in rejected:
+                    known = False
+                    wanted = newer == "ADD_FILE"
+                else:
+                    known = command == "REMOVE_FILE"  # Estado anterior ao lote
+                    wanted = (newer or command) == "ADD_FILE"
+                if known:
+                    self.announced_files.add(filename)
+                else:
+                    self.announced_files.discard(filename)
 
-                if data.get("status") == "success":
-                    file_size = data.get("size")
-                    print(f"Iniciando download do arquivo '{filename}' ({file_size} bytes)...")
-
-                    # Agora, recebe o conteúdo do arquivo
-                    with open(os.path.join(save_path, filename), "wb") as f:
-                        remaining = file_size
-                        while remaining > 0:
-                            chunk = conn.recv(min(1024, remaining))
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                            remaining -= len(chunk)
-
-                    print(f"Download concluído: '{filename}' salvo em {save_path}")
+                if wanted == known:
+                    self.pending_announcements.pop(filename, None)
                 else:
-                    print(f"Erro ao baixar arquivo: {data.get('message')}")
+                    self.pending_announcements[filename] = "ADD_FILE" if wanted else "REMOVE_FILE"
+
+            if retry_delay is not None:
+                self._schedule_flush(retry_delay)
+
+    def batch_tracker(self, operations):
+        """
+        Envia várias operações ao tracker em uma única mensagem BATCH.
+
+        Args:
+            operations (list): Operações no mesmo formato das mensagens avulsas
+                (REGISTER, LIST, REMOVE, ADD_FILE, REMOVE_FILE, SEARCH).
+
+        Returns:
+            dict: A resposta do tracker, com o resultado de cada operação em 'results'.
+            O tracker aplica o lote inteiro ou nada.
+        """
+        return self.request_tracker({"command": "BATCH", "operations": operations})
+
+    def request_tracker(self, message):
+        """Envia uma mensagem ao tracker e retorna a resposta."""
+        with self.tracker_lock:
+            self.tracker_conn.sendall(json.dumps(message).encode())
+            return self._tracker_recv()
+
+    def _tracker_recv(self):
+        """Lê a próxima resposta do tracker; pedidos CONNECT que chegarem no meio são atendidos pelo loop."""
+        while True:
+            message = recv_message(self.tracker_conn, self.tracker_buffer)
+            if message is None:
+                raise ConnectionError("Conexão com o tracker encerrada")
+            if "command" not in message:
+                return message
+            self.call_soon(self.handle_message, None, message)
+
+
+
+    def request_file(self, peer_id, filename, save_path):
+        """Solicita o download de um arquivo de outro peer."""
+        if peer_id in self.connected_peers:
+            try:
+                with self.borrow_connection(peer_id) as state:
+                    request = {"command": "DOWNLOAD", "filename": filename}
+                    state.conn.sendall(json.dumps(request).encode())
+
+                    # Primeiro, recebe e interpreta a resposta JSON com o tamanho do arquivo
+                    try:
+                        data = self._recv_response(state)
+                    except ValueError:
+                        print("Erro: Resposta inválida recebida (não é JSON).")
+                        return
+
+                    if data is None:
+                        print("Erro: Resposta vazia recebida.")
+                        return
+
+                    if data.get("status") == "success":
+                        file_size = data.get("size")
+                        print(f"Iniciando download do arquivo '{filename}' ({file_size} bytes)...")
+
+                        # Agora, recebe o conteúdo do arquivo
+                        with open(os.path.join(save_path, filename), "wb") as f:
+                            for chunk in recv_exact(state.conn, state.buffer, file_size):
+                                f.write(chunk)
+
+                        print(f"Download concluído: '{filename}' salvo em {save_path}")
+                    else:
+                        print(f"Erro ao baixar arquivo: {data.get('message')}")
 
             except Exception as e:
                 print(f"Erro ao solicitar arquivo do peer {peer_id}: {e}")
@@ -227,15 +527,224 @@ class Peer:
 
 
 
+    def request_file_delta(self, peer_id, filename, save_path):
+        """
+        Baixa um arquivo de outro peer transferindo apenas os chunks que faltam localmente.
+
+        Pede o manifesto do arquivo ao peer e reaproveita os chunks já presentes na cópia
+        antiga em `save_path` ou em qualquer arquivo do próprio catálogo; só os demais são
+        pedidos, cada um uma única vez, mesmo que se repitam no arquivo. Se o peer não estiver
+        no modo de chunks, ou não tiver mais algum dos chunks do manifesto, faz o download
+        completo com `request_file`.
+        """
+        if peer_id not in self.connected_peers:
+            print(f"Peer {peer_id} não está conectado.")
+            return
+
+        target = os.path.join(save_path, filename)
+        part = target + ".part"
+        try:
+            with self.borrow_connection(peer_id) as state:
+                state.conn.sendall(json.dumps({"command": "MANIFEST", "filename": filename}).encode())
+                data = self._recv_response(state)
+                if data is None:
+                    print("Erro: Resposta vazia recebida.")
+                    return
+                if data.get("status") != "success":
+                    print(f"Manifesto indisponível ({data.get('message')}); baixando o arquivo inteiro.")
+                    result = None
+                else:
+                    manifest = data["chunks"]
+                    local = self._local_chunks(target)
+                    missing = list(dict.fromkeys(c["hash"] for c in manifest if c["hash"] not in local))
+                    result = self._rebuild_file(state, manifest, local, missing, part)
+                    if result is None:
+                        print("O peer não tem mais todos os chunks do manifesto; baixando o arquivo inteiro.")
+                    else:
+                        received, fetched = result
+                        os.replace(part, target)
+                        print(
+                            f"Download concluído: '{filename}' salvo em {save_path} "
+                            f"({fetched} de {len(manifest)} chunks baixados, {received} de {data['size']} bytes)"
+                        )
+        except Exception as e:
+            print(f"Erro ao solicitar arquivo do peer {peer_id}: {e}")
+            return
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+
+        if result is None:
+            self.request_file(peer_id, filename, save_path)
+
+    def _local_chunks(self, target):
+        """Chunks disponíveis localmente: os do catálogo e os da cópia antiga do arquivo, se existir."""
+        with self.chunk_lock:
+            local = dict(self.chunk_index)
+
+        if os.path.isfile(target):
+            offset = 0
+            for chunk in chunk_file(target):
+                local.setdefault(chunk["hash"], (target, offset, chunk["size"], None))
+                offset += chunk["size"]
+        return local
+
+    def _rebuild_file(self, state, manifest, local, missing, part):
+        """
+        Monta o arquivo em `part` com chunks locais e os chunks `missing` pedidos ao peer.
+
+        Um chunk local que não pode ser lido ou não confere mais com o hash (o arquivo de
+        origem mudou, sumiu ou perdeu a permissão de leitura) é tratado como faltante: o trecho
+        fica reservado, o chunk é pedido ao peer no final e o arquivo de origem é reindexado.
+
+        Returns:
+            tuple | None: (bytes recebidos, chunks baixados), ou None se o peer recusou algum chunk.
+        """
+        incoming = self._request_chunks(state, missing)
+        if incoming is None:
+            return None
+
+        received = 0
+        written = {}  # {hash: offset em part}, para chunks repetidos dentro do arquivo
+        stale = {}  # {hash: [offsets em part]} de chunks locais que mudaram no disco
+        changed = set()  # Arquivos de origem desses chunks
+        with ExitStack() as stack:
+            out = stack.enter_context(open(part, "w+b"))
+            sources = {}
+            for chunk in manifest:
+                chunk_hash = chunk["hash"]
+                position = out.tell()
+                if chunk_hash in stale:
+                    stale[chunk_hash].append(position)
+                    out.write(bytes(chunk["size"]))
+                    continue
+
+                if chunk_hash in written:
+                    out.seek(written[chunk_hash])
+                    block = out.read(chunk["size"])
+                    out.seek(0, os.SEEK_END)
+                elif chunk_hash in local:
+                    file_path, offset, size, _ = local[chunk_hash]
+                    block = self._read_local_chunk(stack, sources, file_path, offset, size)
+                    if block is None or chunk_digest(block) != chunk_hash:
+                        changed.add(file_path)
+                        stale[chunk_hash] = [position]
+                        out.write(bytes(chunk["size"]))
+                        continue
+                else:
+                    block = self._recv_chunk(state, next(incoming))
+                    received += len(block)
+
+                written[chunk_hash] = position
+                out.write(block)
+
+            self._reindex_sources(changed)
+            if stale:
+                incoming = self._request_chunks(state, list(stale))
+                if incoming is None:
+                    return None
+                for chunk in incoming:
+                    block = self._recv_chunk(state, chunk)
+                    received += len(block)
+                    for position in stale[chunk[0]]:
+                        out.seek(position)
+                        out.write(block)
+        return received, len(missing) + len(stale)
+
+    def _read_local_chunk(self, stack, sources, file_path, offset, size):
+        """Lê um chunk de um arquivo local, abrindo-o em `stack`; retorna None se a leitura falhar."""
+        try:
+            if file_path not in sources:
+                sources[file_path] = stack.enter_context(open(file_path, "rb"))
+            sources[file_path].seek(offset)
+            return sources[file_path].read(size)
+        except OSError:
+            return None
+
+    def _request_chunks(self, state, hashes):
+        """Pede chunks ao peer; retorna um iterador de (hash, tamanho) na ordem de chegada, ou None se recusado."""
+        if not hashes:
+            return iter(())
+
+        state.conn.sendall(json.dumps({"command": "GET_CHUNKS", "hashes": hashes}).encode())
+        data = self._recv_response(state)
+        if data is None:
+            raise ValueError("Resposta vazia recebida")
+        if data.get("status") != "success":
+            return None
+        return iter(zip(hashes, data["sizes"]))
+
+    def _recv_chunk(self, state, chunk):
+        chunk_hash, size = chunk
+        block = b"".join(recv_exact(state.conn, state.buffer, size))
+        if chunk_digest(block) != chunk_hash:
+            raise ValueError(f"Chunk {chunk_hash[:12]} corrompido recebido")
+        return block
+
+    def manifest_for(self, filename):
+        """
+        Retorna o manifesto de chunks de um arquivo compartilhado, recalculando-o se o arquivo mudou.
+
+        Os chunks de todos os arquivos do catálogo ficam em `chunk_index`, que guarda um único
+        local por hash: chunks repetidos entre arquivos são servidos e reaproveitados da mesma origem.
+        """
+        file_path = self.files[filename]
+        key = _file_key(file_path)
+
+        with self.chunk_lock:
+            cached = self.manifests.get(filename)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        manifest = chunk_file(file_path)
+        with self.chunk_lock:
+            if self.files.get(filename) != file_path:
+                return manifest  # Removido ou substituído durante o cálculo: não entra no índice
+            self.manifests[filename] = (key, manifest)
+            if cached:
+                self._rebuild_chunk_index()  # Os locais antigos deste arquivo não valem mais
+            else:
+                self._index_chunks(file_path, manifest, key)
+        return manifest
+
+    def _index_later(self, filename):
+        """Calcula o manifesto de um arquivo em segundo plano (apenas no modo de chunks)."""
+        if self.chunking:
+            self.index_pool.submit(self._index_file, filename, self.files[filename])
+
+    def _reindex_sources(self, paths):
+        """Reindexa os arquivos compartilhados em `paths`; os que não puderem ser lidos deixam de ser compartilhados."""
+        for filename, file_path in list(self.files.items()):
+            if file_path in paths:
+                self._index_later(filename)
+
+    def _index_file(self, filename, file_path):
+        try:
+            self.manifest_for(filename)
+        except Exception as e:
+            print(f"Erro ao indexar '{file_path}': {e}")
+            if self.files.get(filename) == file_path:
+                self.remove_file(filename)
+
+    def _index_chunks(self, file_path, manifest, key):
+        offset = 0
+        for chunk in manifest:
+            self.chunk_index.setdefault(chunk["hash"], (file_path, offset, chunk["size"], key))
+            offset += chunk["size"]
+
+    def _rebuild_chunk_index(self):
+        self.chunk_index = {}
+        for filename, (key, manifest) in self.manifests.items():
+            if filename in self.files:
+                self._index_chunks(self.files[filename], manifest, key)
+
     def request_file_list(self, peer_id):
         """Solicita a lista de arquivos de um peer conectado."""
         if peer_id in self.connected_peers:
             try:
-                conn = self.connected_peers[peer_id]
-                conn.sendall(json.dumps({"command": "LIST_FILES"}).encode())
-
-                response = conn.recv(1024).decode()
-                data = json.loads(response)
+                with self.borrow_connection(peer_id) as state:
+                    state.conn.sendall(json.dumps({"command": "LIST_FILES"}).encode())
+                    data = self._recv_response(state) or {}
                 print(f"Arquivos disponíveis no peer {peer_id}: {data.get('files', [])}")
             except Exception as e:
                 print(f"Erro ao solicitar arquivos do peer {peer_id}: {e}")
@@ -243,68 +752,93 @@ class Peer:
             print(f"Peer {peer_id} não está conectado.")
 
 
-    def handle_message(self, conn):
-        """Processa mensagens recebidas de outros peers."""
-        while True:
-            try:
-                data = conn.recv(1024)
-                if not data:
-                    break
-                message = json.loads(data.decode())
-                command = message.get("command")
-
-                if command == "CHAT":
-                    print(f"Mensagem recebida: {message.get('message')}")
-                
-                elif command == "CONNECT":
-                    target_host = message.get("target_host")
-                    target_port = message.get("target_port")
-                    print(f"[DEBUG] Recebido pedido de conexão com {target_host}:{target_port}")
-                    if target_host and target_port:
-                        target_id = f"{target_host}:{target_port}"
-                        self.connect_to_peer(target_id, target_host, int(target_port))
-
-                elif command == "LIST_FILES":
-                    files_list = list(self.files.keys())  # Lista apenas os nomes dos arquivos
-                    conn.sendall(json.dumps({"files": files_list}).encode())
-
-                elif command == "BUSCAR":
-                    filename = input("Digite o nome do arquivo que deseja buscar: ").strip()
-                    self.search_file(filename)  
-
-                elif command == "DISCONNECT":
-                    leaving_peer = message.get("peer_id")
-                    if leaving_peer in self.connected_peers:
-                        del self.connected_peers[leaving_peer]
-                        print(f"[INFO] Peer {leaving_peer} foi desconectado e removido da lista de peers.")
-
-                elif command == "DOWNLOAD":
-                    filename = message.get("filename")
-                    if filename in self.files:
-                        file_path = self.files[filename]
-                        try:
-                            file_size = os.path.getsize(file_path)
-                            conn.sendall(json.dumps({"status": "success", "size": file_size}).encode())
-
-                            # Aguarda um pequeno intervalo para evitar mistura de JSON com binário
-                            time.sleep(0.2)
-
-                            # Agora, envia o arquivo em pedaços de 1024 bytes
-                            with open(file_path, "rb") as f:
-                                while chunk := f.read(1024):
-                                    conn.sendall(chunk)
-
-                            print(f"Arquivo '{filename}' enviado com sucesso.")
-                        except Exception as e:
-                            conn.sendall(json.dumps({"status": "error", "message": str(e)}).encode())
-                    else:
-                        conn.sendall(json.dumps({"status": "error", "message": "Arquivo não encontrado"}).encode())
+    def handle_message(self, state, message):
+        """Processa uma mensagem recebida de outro peer (executado na thread do loop)."""
+        command = message.get("command")
 
-                else:
-                    print("Comando desconhecido recebido.")
-            except Exception as e:
-                print(f"Erro ao processar mensagem: {e}")
-                break
+        if command == "CHAT":
+            print(f"Mensagem recebida: {message.get('message')}")
+
+        elif command == "HELLO":
+            self._identify(state, message.get("peer_id"))
+
+        elif command == "GOSSIP":
+            self._identify(state, message.get("sender"))
+            self.gossip.receive(message.get("messages", []), state.peer_id or state, self.neighbors)
+
+        elif command == "CONNECT":
+            target_host = message.get("target_host")
+            target_port = message.get("target_port")
+            print(f"[DEBUG] Recebido pedido de conexão com {target_host}:{target_port}")
+            if target_host and target_port:
+                target_id = f"{target_host}:{target_port}"
+                self.connect_to_peer(target_id, target_host, int(target_port))
+
+        elif command == "LIST_FILES":
+            files_list = list(self.files.keys())  # Lista apenas os nomes dos arquivos
+            self._send(state, {"files": files_list})
+
+        elif command == "BUSCAR":
+            # A busca interativa só pode ser iniciada pelo usuário local, nunca por outro peer
+            self._send(state, {"status": "error", "message": "Comando não permitido"})
+
+        elif command == "DISCONNECT":
+            leaving_peer = message.get("peer_id")
+            if leaving_peer in self.connected_peers:
+                del self.connected_peers[leaving_peer]
+                print(f"[INFO] Peer {leaving_peer} foi desconectado e removido da lista de peers.")
+
+        elif command == "DOWNLOAD":
+            filename = message.get("filename")
+            if filename in self.files:
+                self._queue_upload(state, self._upload_file, filename)
+            else:
+                self._send(state, {"status": "error", "message": "Arquivo não encontrado"})
+
+        elif command == "MANIFEST":
+            filename = message.get("filename")
+            if not self.chunking:
+                self._send(state, {"status": "error", "message": "Modo de chunks desativado"})
+            elif filename in self.files:
+                self._queue_upload(state, self._upload_manifest, filename)
+            else:
+                self._send(state, {"status": "error", "message": "Arquivo não encontrado"})
+
+        elif command == "GET_CHUNKS":
+            if not self.chunking:
+                self._send(state, {"status": "error", "message": "Modo de chunks desativado"})
+            else:
+                self._queue_upload(state, self._upload_chunks, message.get("hashes", []))
+
+        else:
+            print("Comando desconhecido recebido.")
+
+    def _publish_gossip(self, text, group):
+        self.gossip.publish(text, self.neighbors, group=group)
+
+    def _identify(self, state, peer_id):
+        """
+        Associa uma conexão de entrada ao peer que a abriu, tornando-a um vizinho do overlay.
+
+        Só contam como vizinhos conexões cujo peer é conhecido (de saída, ou de entrada depois
+        de um HELLO ou GOSSIP); conexões avulsas, como as de `query_peer_for_file`, nunca
+        recebem gossip.
+        """
+        if isinstance(peer_id, str) and peer_id and state.peer_id is None:
+            state.peer_id = peer_id
+            self.neighbors.setdefault(peer_id, state)
+
+    def _send_gossip(self, neighbor, messages):
+        state = self.neighbors.get(neighbor)
+        if state is None:
+            return  # O vizinho desconectou durante a janela do lote
+        self._send(state, {"command": "GOSSIP", "sender": f"{self.host}:{self.port}", "messages": messages})
+
+    def _deliver_gossip(self, message):
+        if message.get("group") is None:
+            print(f"Mensagem recebida de {message['origin']} (todos): {message['message']}")
+        else:
+            print(f"Mensagem recebida de {message['origin']} no grupo '{message['group']}': {message['message']}")
 
     def remove_from_tracker(self):
         """Remove este peer do Tracker e notifica os peers conectados."""
@@ -318,43 +852,433 @@ class Peer:
         message = {"command": "REMOVE", "peer_id": f"{self.host}:{self.port}"}
 
         try:
-            self.tracker_conn.sendall(json.dumps(message).encode())
-            response = self.tracker_conn.recv(1024).decode()
-            print(response)
+            print(json.dumps(self.request_tracker(message)))
         except Exception as e:
             print(f"Erro ao remover peer do Tracker: {e}")
 
 
     def notify_peers_before_exit(self):
         """Notifica todos os peers conectados que este peer está saindo."""
+        try:
+            self.run_in_loop(self._disconnect_all)
+        except Exception as e:
+            print(f"Erro ao notificar peers sobre saída: {e}")
+
+        # Limpar lista de peers conectados
+        self.connected_peers.clear()
+
+    def _disconnect_all(self):
+        notice = json.dumps({"command": "DISCONNECT", "peer_id": f"{self.host}:{self.port}"}).encode()
         for peer_id, conn in list(self.connected_peers.items()):
+            state = self.connections.get(conn)
             try:
-                conn.sendall(json.dumps({"command": "DISCONNECT", "peer_id": f"{self.host}:{self.port}"}).encode())
-                conn.close()
+                if state.attached:
+                    self._detach(state)
+                conn.settimeout(1)
+                conn.sendall(bytes(state.outbox) + notice)
             except Exception as e:
                 print(f"Erro ao notificar {peer_id} sobre saída: {e}")
-        
-        # Limpar lista de peers conectados
-        self.connected_peers.clear()
+            finally:
+                self._close(state)
 
 
 
     def start(self):
-        """Inicia o peer para escutar conexões e lidar com mensagens em uma thread separada."""
-        
-        def listen():
-            try:
-                self.socket.bind((self.host, self.port))
-                self.socket.listen()
-                print(f"Peer escutando em {self.host}:{self.port}")
+        """Inicia o peer para escutar conexões; todas elas são atendidas pelo loop de eventos em segundo plano."""
+        try:
+            self.socket.bind((self.host, self.port))
+            self.socket.listen(socket.SOMAXCONN)
+            self.socket.setblocking(False)
+            print(f"Peer escutando em {self.host}:{self.port}")
+        except Exception as e:
+            print(f"Erro ao iniciar o peer: {e}")
+            return
+
+        self.listening = True
+        self.call_soon(self._set_accepting, True)
+
+    # ------------------------------------------------------------------
+    # Loop de eventos
+    # ------------------------------------------------------------------
+
+    def call_soon(self, callback, *args):
+        """Agenda `callback(*args)` para rodar na thread do loop de eventos. Pode ser chamado de qualquer thread."""
+        self.pending_calls.append((callback, args))
+        self._ensure_loop()
+        try:
+            self.wakeup_send.send(b"\0")
+        except OSError:
+            pass  # Buffer cheio: o loop já tem um despertar pendente
 
-                while True:
-                    conn, addr = self.socket.accept()
-                    threading.Thread(target=self.handle_message, args=(conn,)).start()
+    def run_in_loop(self, callback, *args, timeout=10):
+        """Executa `callback(*args)` na thread do loop e aguarda o resultado."""
+        if threading.current_thread() is self.loop_thread:
+            return callback(*args)
+
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(callback(*args))
             except Exception as e:
-                print(f"Erro ao iniciar o peer: {e}")
+                future.set_exception(e)
+
+        self.call_soon(run)
+        return future.result(timeout)
+
+    @contextmanager
+    def borrow_connection(self, peer_id):
+        """
+        Retira temporariamente a conexão com um peer do loop de eventos.
+
+        Usado para trocas síncronas de requisição/resposta (downloads, listagem de arquivos):
+        enquanto emprestado o socket fica em modo bloqueante e o loop não o lê. Ao sair do
+        bloco a conexão volta para o loop.
+        """
+        state, pending = self.run_in_loop(self._lend, peer_id)
+        try:
+            # Dados que o loop ainda não conseguiu enviar saem antes da requisição, nesta thread
+            if pending:
+                state.conn.sendall(pending)
+            yield state
+        except Exception:
+            # A troca foi interrompida no meio; o que restar no socket não pode ser reaproveitado
+            self.call_soon(self._close, state)
+            raise
+        self.call_soon(self._resume, state)
+
+    def _ensure_loop(self):
+        with self.loop_lock:
+            if self.loop_thread is None:
+                self.loop_thread = threading.Thread(target=self._run_loop, name="peer-loop", daemon=True)
+                self.loop_thread.start()
+
+    def call_later(self, delay, callback, *args):
+        """Agenda `callback(*args)` para daqui a `delay` segundos. Deve ser chamado na thread do loop."""
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self.timer_seq), callback, args))
+
+    def _run_loop(self):
+        while True:
+            timeout = None
+            if self.pending_calls:
+                timeout = 0
+            elif self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+
+            for key, events in self.selector.select(timeout):
+                try:
+                    if isinstance(key.data, PeerConnection):
+                        self._handle_events(key.data, events)
+                    else:
+                        key.data()
+                except Exception as e:
+                    print(f"Erro no loop de eventos: {e}")
+
+            while self.timers and self.timers[0][0] <= time.monotonic():
+                _, _, callback, args = heapq.heappop(self.timers)
+                self.pending_calls.append((callback, args))
 
-        # Iniciar a thread do listener
-        threading.Thread(target=listen, daemon=True).start()
+            while self.pending_calls:
+                callback, args = self.pending_calls.popleft()
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"Erro no loop de eventos: {e}")
+
+    def _drain_wakeup(self):
+        try:
+            while self.wakeup_recv.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _set_accepting(self, accepting):
+        """Liga ou desliga a aceitação de novas conexões (contrapressão ao atingir max_connections)."""
+        if accepting == self.accepting or not self.listening:
+            return
+        if accepting:
+            self.selector.register(self.socket, selectors.EVENT_READ, self._accept)
+        else:
+            self.selector.unregister(self.socket)
+        self.accepting = accepting
+
+    def _accept(self):
+        while len(self.connections) < self.max_connections:
+            try:
+                conn, addr = self.socket.accept()
+            except BlockingIOError:
+                return
+
+            state = PeerConnection(conn, address=addr)
+            self.connections[conn] = state
+            self._attach(state)
+
+        print(f"[INFO] Limite de {self.max_connections} conexões atingido; novas conexões aguardarão.")
+        self._set_accepting(False)
+
+    def _attach(self, state):
+        state.conn.setblocking(False)
+        self.selector.register(state.conn, self._interest(state), state)
+        state.attached = True
+
+    def _detach(self, state):
+        self.selector.unregister(state.conn)
+        state.attached = False
+        state.conn.setblocking(True)
+
+    def _interest(self, state):
+        if state.outbox or state.connecting is not None:
+            return selectors.EVENT_READ | selectors.EVENT_WRITE
+        return selectors.EVENT_READ
+
+    def _update_interest(self, state):
+        if state.attached:
+            self.selector.modify(state.conn, self._interest(state), state)
+
+    def _handle_events(self, state, events):
+        if state.closed or not state.attached:
+            return
+        if events & selectors.EVENT_WRITE:
+            if state.connecting is not None:
+                self._finish_connect(state)
+            else:
+                self._flush(state)
+        if events & selectors.EVENT_READ and state.attached:
+            self._read(state)
+
+    def _read(self, state):
+        try:
+            chunk = state.conn.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+
+        if not chunk:
+            self._close(state)
+            return
+
+        state.buffer.feed(chunk)
+        self._process_buffer(state)
+
+    def _process_buffer(self, state):
+        try:
+            # Uma mensagem pode tirar a conexão do loop (upload); as seguintes esperam a volta
+            while state.attached:
+                message = state.buffer.next_message()
+                if message is None:
+                    break
+                self.handle_message(state, message)
+        except Exception as e:
+            print(f"Erro ao processar mensagem: {e}")
+            self._close(state)
+
+    def _send(self, state, message):
+        """Enfileira uma mensagem para envio (executado na thread do loop)."""
+        state.outbox += json.dumps(message).encode()
+        if state.attached and state.connecting is None:
+            self._flush(state)
+
+    def _flush(self, state):
+        try:
+            sent = state.conn.send(state.outbox)
+        except BlockingIOError:
+            sent = 0
+        except OSError as e:
+            print(f"Erro ao enviar dados para {state.peer_id or state.address}: {e}")
+            self._close(state)
+            return
+        del state.outbox[:sent]
+        self._update_interest(state)
+
+    def _close(self, state):
+        if state.closed:
+            return
+        state.closed = True
+        if state.attached:
+            self.selector.unregister(state.conn)
+            state.attached = False
+        state.conn.close()
+        self.connections.pop(state.conn, None)
+        if state.peer_id and self.connected_peers.get(state.peer_id) is state.conn:
+            del self.connected_peers[state.peer_id]
+        if state.peer_id and self.neighbors.get(state.peer_id) is state:
+            del self.neighbors[state.peer_id]
+            # Outra conexão aberta com o mesmo peer (os dois se conectaram) assume o lugar
+            for other in self.connections.values():
+                if other.peer_id == state.peer_id and other.connecting is None:
+                    self.neighbors[other.peer_id] = other
+                    break
+        if state.connecting is not None:
+            state.connecting.set_result(False)
+            state.connecting = None
+        if len(self.connections) < self.max_connections:
+            self._set_accepting(True)
+
+    def _open_connection(self, peer_id, peer_host, peer_port, future):
+        if peer_id in self.connected_peers:
+            future.set_result(True)
+            return
+
+        conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        conn.setblocking(False)
+        err = conn.connect_ex((peer_host, peer_port))
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            conn.close()
+            print(f"Erro ao conectar ao peer {peer_id}: {os.strerror(err)}")
+            future.set_result(False)
+            return
+
+        state = PeerConnection(conn, peer_id=peer_id, address=(peer_host, peer_port))
+        state.connecting = future
+        self.connections[conn] = state
+        self._attach(state)
+
+    def _finish_connect(self, state):
+        err = state.conn.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            print(f"Erro ao conectar ao peer {state.peer_id}: {os.strerror(err)}")
+            self._close(state)
+            return
+
+        future, state.connecting = state.connecting, None
+        self.connected_peers[state.peer_id] = state.conn
+        self.neighbors.setdefault(state.peer_id, state)
+        peer_host, peer_port = state.address
+        print(f"Conectado ao peer {state.peer_id} em {peer_host}:{peer_port}")
+        # Identifica-se para que o outro lado possa usar esta conexão como vizinho no gossip
+        self._send(state, {"command": "HELLO", "peer_id": f"{self.host}:{self.port}"})
+        future.set_result(True)
+
+    def _send_to_peer(self, peer_id, message):
+        conn = self.connected_peers.get(peer_id)
+        if conn is None:
+            print(f"Peer {peer_id} não está conectado.")
+            return
+        self._send(self.connections[conn], message)
+
+    def _lend(self, peer_id):
+        conn = self.connected_peers.get(peer_id)
+        if conn is None:
+            raise ConnectionError(f"Peer {peer_id} não está conectado.")
+        state = self.connections[conn]
+        if not state.attached:
+            raise ConnectionError(f"Conexão com {peer_id} está ocupada.")
+
+        self._detach(state)
+        return state, self._take_outbox(state)
+
+    def _take_outbox(self, state):
+        """Retira os bytes pendentes de envio (na thread do loop) para que outra thread os envie."""
+        pending = bytes(state.outbox)
+        state.outbox.clear()
+        return pending
+
+    def _resume(self, state):
+        """Devolve ao loop uma conexão emprestada ou usada por um upload."""
+        if state.closed:
+            return
+        self._attach(state)
+        self._process_buffer(state)
+
+    def _recv_response(self, state):
+        """Lê a resposta de uma conexão emprestada; comandos que chegarem no meio são repassados ao loop."""
+        while True:
+            message = recv_message(state.conn, state.buffer)
+            if message is None or "command" not in message:
+                return message
+            self.call_soon(self.handle_message, state, message)
+
+    # ------------------------------------------------------------------
+    # Uploads
+    # ------------------------------------------------------------------
+
+    def _queue_upload(self, state, job, *args):
+        """Tira a conexão do loop e coloca `job(state, *args)` na fila do pool de uploads."""
+        self._detach(state)
+        self.waiting_uploads.append((state, self._take_outbox(state), job, args))
+        self._start_uploads()
+
+    def _start_uploads(self):
+        while self.waiting_uploads and self.active_uploads < self.max_uploads:
+            state, pending, job, args = self.waiting_uploads.popleft()
+            if state.closed:
+                continue
+            self.active_uploads += 1
+            future = self.upload_pool.submit(self._run_upload, state, pending, job, args)
+            future.add_done_callback(lambda f, state=state: self.call_soon(self._finish_upload, state, f))
+
+    def _finish_upload(self, state, future):
+        self.active_uploads -= 1
+        if future.exception() is not None:
+            print(f"Erro ao enviar arquivo: {future.exception()}")
+            self._close(state)
+        else:
+            self._resume(state)
+        self._start_uploads()
+
+    def _run_upload(self, state, pending, job, args):
+        # Respostas enfileiradas antes do pedido precisam sair antes dos dados do upload. O que o
+        # loop enfileirar durante o upload fica em state.outbox e é enviado quando a conexão volta.
+        if pending:
+            state.conn.sendall(pending)
+        job(state, *args)
+
+    def _upload_file(self, state, filename):
+        """Envia um arquivo pela conexão (executado no pool de uploads)."""
+        conn = state.conn
+        file_path = self.files.get(filename)
+        try:
+            file_size = os.path.getsize(file_path)
+        except Exception as e:
+            conn.sendall(json.dumps({"status": "error", "message": str(e)}).encode())
+            return
+
+        conn.sendall(json.dumps({"status": "success", "size": file_size}).encode())
+        with open(file_path, "rb") as f:
+            conn.sendfile(f)
+
+        print(f"Arquivo '{filename}' enviado com sucesso.")
+
+    def _upload_manifest(self, state, filename):
+        """Envia o manifesto de chunks de um arquivo (executado no pool de uploads)."""
+        try:
+            manifest = self.manifest_for(filename)
+        except Exception as e:
+            state.conn.sendall(json.dumps({"status": "error", "message": str(e)}).encode())
+            return
+
+        state.conn.sendall(json.dumps({
+            "status": "success",
+            "filename": filename,
+            "size": sum(chunk["size"] for chunk in manifest),
+            "chunks": manifest,
+        }).encode())
+
+    def _upload_chunks(self, state, hashes):
+        """Envia o cabeçalho com os tamanhos e, em seguida, o conteúdo dos chunks pedidos, na ordem."""
+        with self.chunk_lock:
+            locations = [self.chunk_index.get(chunk_hash) for chunk_hash in hashes]
+
+        if None in locations:
+            state.conn.sendall(json.dumps({"status": "error", "message": "Chunk não encontrado"}).encode())
+            return
+
+        # Um arquivo alterado desde a indexação não tem mais os chunks nos locais registrados
+        changed = {file_path for file_path, _, _, key in locations if _file_key(file_path) != key}
+        if changed:
+            self._reindex_sources(changed)
+            state.conn.sendall(json.dumps({"status": "error", "message": "Chunk desatualizado"}).encode())
+            return
 
-                
\ No newline at end of file
+        state.conn.sendall(json.dumps({"status": "success", "sizes": [size for _, _, size, _ in locations]}).encode())
+        with ExitStack() as stack:
+            opened = {}
+            for file_path, offset, size, _ in locations:
+                if file_path not in opened:
+                    opened[file_path] = stack.enter_context(open(file_path, "rb"))
+                f = opened[file_path]
+                f.seek(offset)
+                state.conn.sendall(f.read(size))
+
+        print(f"{len(hashes)} chunk(s) enviados.")
@@ -0,0 +1,139 @@
+import json
+import re
+
+
+class MessageBuffer:
+    """
+    Acumula bytes recebidos de um socket e separa as mensagens JSON.
+
+    O protocolo entre peers e tracker envia objetos JSON sem delimitador, então
+    uma única leitura pode conter meia mensagem, várias mensagens juntas ou uma
+    mensagem seguida de dados binários (no caso de downloads). Este buffer
+    localiza o fim de cada objeto JSON sem decodificar o restante dos bytes.
+    """
+
+    def __init__(self):
+        self.data = b""
+        self._reset_scan()
+
+    def _reset_scan(self):
+        # Estado da varredura do objeto incompleto, para não reler os bytes a cada leitura
+        self.scan_pos = 0
+        self.depth = 0
+        self.in_string = False
+
+    def feed(self, chunk):
+        """Adiciona bytes recebidos ao buffer."""
+        self.data += chunk
+
+    def next_message(self):
+        """
+        Retira a próxima mensagem completa do buffer.
+
+        Returns:
+            dict | None: A mensagem decodificada, ou None se ainda não houver
+            um objeto JSON completo no buffer.
+
+        Raises:
+            ValueError: Se o início do buffer não for um objeto JSON.
+        """
+        if self.scan_pos == 0:
+            self.data = self.data.lstrip()
+            if not self.data:
+                return None
+            if self.data[:1] != b"{":
+                self.data = b""
+                raise ValueError("Mensagem inválida recebida (não é JSON)")
+
+        end = self._scan()
+        if end < 0:
+            return None
+
+        message, self.data = self.data[:end], self.data[end:]
+        self._reset_scan()
+        return json.loads(message.decode())
+
+    def messages(self):
+        """Itera sobre todas as mensagens completas presentes no buffer."""
+        while True:
+            message = self.next_message()
+            if message is None:
+                return
+            yield message
+
+    def take(self, size):
+        """Retira até `size` bytes brutos do início do buffer."""
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def _scan(self):
+        """Continua a varredura do objeto JSON no início do buffer; retorna o índice logo após ele, ou -1."""
+        data = self.data
+        pos = self.scan_pos
+        while True:
+            pattern = _STRING_TOKENS if self.in_string else _STRUCTURE_TOKENS
+            match = pattern.search(data, pos)
+            if match is None:
+                self.scan_pos = len(data)
+                return -1
+
+            token = match.group()
+            pos = match.end()
+            if self.in_string:
+                if token == b"\\":
+                    if pos >= len(data):
+                        # Barra no fim do buffer: revê o escape quando chegarem mais bytes
+                        self.scan_pos = pos - 1
+                        return -1
+                    pos += 1
+                else:
+                    self.in_string = False
+            elif token == b'"':
+                self.in_string = True
+            elif token in (b"{", b"["):
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth == 0:
+                    return pos
+
+
+# Bytes de UTF-8 multibyte são sempre >= 0x80, então nunca se confundem com estes tokens
+_STRUCTURE_TOKENS = re.compile(rb'[{}\[\]"]')
+_STRING_TOKENS = re.compile(rb'["\\]')
+
+
+def recv_message(conn, buffer, bufsize=4096):
+    """
+    Lê de um socket bloqueante até obter uma mensagem JSON completa.
+
+    Args:
+        conn (socket.socket): Socket de onde ler.
+        buffer (MessageBuffer): Buffer associado a essa conexão.
+        bufsize (int): Quantidade máxima de bytes por leitura.
+
+    Returns:
+        dict | None: A mensagem recebida, ou None se a conexão foi encerrada.
+    """
+    while True:
+        message = buffer.next_message()
+        if message is not None:
+            return message
+        chunk = conn.recv(bufsize)
+        if not chunk:
+            return None
+        buffer.feed(chunk)
+
+
+def recv_exact(conn, buffer, size, bufsize=4096):
+    """Gera blocos de bytes brutos até completar `size` bytes, usando primeiro o que já está no buffer."""
+    remaining = size
+    pending = buffer.take(remaining)
+    while remaining > 0:
+        if not pending:
+            pending = conn.recv(min(bufsize, remaining))
+            if not pending:
+                return
+        remaining -= len(pending)
+        yield pending
+        pending = b""
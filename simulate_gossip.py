@@ -0,0 +1,140 @@
+"""
+Simula o gossip de chat em uma rede de peers e mede latência de entrega e duplicatas.
+
+Uso: python simulate_gossip.py [--peers 200] [--degree 4] [--ttl 8] [--fanout N] ...
+
+A simulação usa o mesmo GossipRouter dos peers, trocando os sockets por uma fila de
+eventos com relógio simulado: cada enlace do overlay tem uma latência fixa sorteada.
+"""
+import argparse
+import heapq
+import itertools
+import random
+import statistics
+
+from gossip import GossipRouter
+
+
+class Simulation:
+    def __init__(self, args):
+        self.now = 0.0
+        self.events = []  # heap [(quando, seq, callback, args)]
+        self.seq = itertools.count()
+        self.published_at = {}  # {message_id: (instante, grupo, origem)}
+        self.latencies = []
+        self.frames = 0
+
+        rng = random.Random(args.seed)
+        peer_ids = [f"peer{i}" for i in range(args.peers)]
+        self.neighbors = {peer_id: set() for peer_id in peer_ids}
+        self.latency = {}
+
+        # Anel para garantir que o overlay seja conexo, mais enlaces aleatórios até o grau pedido
+        for i, peer_id in enumerate(peer_ids):
+            self.link(peer_id, peer_ids[(i + 1) % len(peer_ids)], rng, args)
+        for peer_id in peer_ids:
+            while len(self.neighbors[peer_id]) < args.degree:
+                other = rng.choice(peer_ids)
+                if other != peer_id:
+                    self.link(peer_id, other, rng, args)
+
+        self.routers = {}
+        for peer_id in peer_ids:
+            self.routers[peer_id] = GossipRouter(
+                peer_id,
+                send=lambda neighbor, messages, sender=peer_id: self.transmit(sender, neighbor, messages),
+                schedule=self.schedule,
+                deliver=lambda message, receiver=peer_id: self.delivered(receiver, message),
+                ttl=args.ttl,
+                fanout=args.fanout,
+                seen_capacity=args.seen_capacity,
+                batch_window=args.batch_window,
+                batch_size=args.batch_size,
+            )
+
+        self.group = set(rng.sample(peer_ids, int(len(peer_ids) * args.group_fraction)))
+        for peer_id in self.group:
+            self.routers[peer_id].groups.add("grupo")
+
+        for i in range(args.messages):
+            origin = rng.choice(peer_ids)
+            group = "grupo" if rng.random() < args.group_messages else None
+            self.schedule(rng.uniform(0, args.duration), self.publish, origin, f"mensagem {i}", group)
+
+    def link(self, a, b, rng, args):
+        self.neighbors[a].add(b)
+        self.neighbors[b].add(a)
+        self.latency[a, b] = self.latency[b, a] = rng.uniform(args.min_latency, args.max_latency)
+
+    def schedule(self, delay, callback, *args):
+        heapq.heappush(self.events, (self.now + delay, next(self.seq), callback, args))
+
+    def run(self):
+        while self.events:
+            self.now, _, callback, args = heapq.heappop(self.events)
+            callback(*args)
+
+    def publish(self, origin, text, group):
+        message = self.routers[origin].publish(text, self.neighbors[origin], group=group)
+        self.published_at[message["id"]] = (self.now, group, origin)
+
+    def transmit(self, sender, receiver, messages):
+        self.frames += 1
+        router = self.routers[receiver]
+        self.schedule(self.latency[sender, receiver], router.receive, messages, sender, self.neighbors[receiver])
+
+    def delivered(self, receiver, message):
+        published, _, _ = self.published_at[message["id"]]
+        self.latencies.append(self.now - published)
+
+    def expected_deliveries(self):
+        """Entregas esperadas: todos os outros peers (broadcast) ou os outros membros do grupo."""
+        total = 0
+        for _, group, origin in self.published_at.values():
+            receivers = self.routers.keys() if group is None else self.group
+            total += len(receivers) - (origin in receivers)
+        return total
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--peers", type=int, default=200)
+    parser.add_argument("--degree", type=int, default=4, help="grau mínimo de cada peer no overlay")
+    parser.add_argument("--ttl", type=int, default=8)
+    parser.add_argument("--fanout", type=int, default=None, help="vizinhos por repasse (padrão: todos)")
+    parser.add_argument("--seen-capacity", type=int, default=4096)
+    parser.add_argument("--batch-window", type=float, default=0.01, help="segundos")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--messages", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=5.0, help="intervalo em que as mensagens são publicadas (s)")
+    parser.add_argument("--group-fraction", type=float, default=0.25, help="fração dos peers no grupo")
+    parser.add_argument("--group-messages", type=float, default=0.2, help="fração das mensagens enviadas ao grupo")
+    parser.add_argument("--min-latency", type=float, default=0.005, help="segundos")
+    parser.add_argument("--max-latency", type=float, default=0.05, help="segundos")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sim = Simulation(args)
+    sim.run()
+
+    totals = {key: sum(router.stats[key] for router in sim.routers.values()) for key in ("received", "duplicates", "forwarded")}
+    expected = sim.expected_deliveries()
+    print(f"Peers: {args.peers}, enlaces: {sum(map(len, sim.neighbors.values())) // 2}, mensagens: {len(sim.published_at)}")
+    print(f"Entregas: {len(sim.latencies)} de {expected} ({100 * len(sim.latencies) / expected:.1f}%)")
+    print(
+        f"Latência (ms): média {1000 * statistics.mean(sim.latencies):.1f}, "
+        f"p50 {1000 * percentile(sim.latencies, 0.5):.1f}, "
+        f"p95 {1000 * percentile(sim.latencies, 0.95):.1f}, "
+        f"máx {1000 * max(sim.latencies):.1f}"
+    )
+    print(f"Duplicatas: {totals['duplicates']} de {totals['received']} recebidas ({100 * totals['duplicates'] / totals['received']:.1f}%)")
+    print(f"Repasses: {totals['forwarded']} em {sim.frames} quadros ({totals['forwarded'] / sim.frames:.2f} mensagens por quadro)")
+
+
+if __name__ == "__main__":
+    main()
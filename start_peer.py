@@ -2,13 +2,14 @@ from peers import Peer
 import sys
 
 if len(sys.argv) < 2:
-    print("Uso: python start_peer.py <porta>")
+    print("Uso: python start_peer.py <porta> [--chunks]")
     sys.exit(1)
 
 PEER_HOST = "127.0.0.1"
 PEER_PORT = int(sys.argv[1])
+CHUNKING = "--chunks" in sys.argv[2:]
 
-peer = Peer(PEER_HOST, PEER_PORT)
+peer = Peer(PEER_HOST, PEER_PORT, chunking=CHUNKING)
 peer.connect_to_tracker("127.0.0.1", 5000)
 
 peer.start()  # Agora roda em segundo plano
@@ -22,6 +23,19 @@ while True:
         mensagem = input("Digite a mensagem: ")
         peer.send_message_to_peer(recipient_id, mensagem)
 
+    elif comando == "todos":
+        mensagem = input("Digite a mensagem: ")
+        peer.broadcast_message(mensagem)
+
+    elif comando == "entrar":
+        group = input("Digite o nome do grupo: ").strip()
+        peer.join_group(group)
+
+    elif comando == "grupo":
+        group = input("Digite o nome do grupo: ").strip()
+        mensagem = input("Digite a mensagem: ")
+        peer.send_group_message(group, mensagem)
+
     elif comando == "conectar":
         print("[INFO] Iniciando conexão com peers disponíveis no tracker...")
         peer.discover_and_connect_peers()
@@ -33,6 +47,10 @@ while True:
         file_path = input("Digite o caminho do arquivo para adicionar: ").strip()
         peer.add_file(file_path)
 
+    elif comando == "compartilhar":
+        directory = input("Digite o diretório a compartilhar: ").strip()
+        peer.share_directory(directory)
+
     elif comando == "buscar":
         filename = input("Digite o nome do arquivo que deseja buscar: ").strip()
         peer.search_file(filename)
@@ -43,6 +61,12 @@ while True:
         save_path = input("Local de destino para dowload")
         peer.request_file(peer_id, filename, save_path)
 
+    elif comando == "sincronizar":
+        peer_id = input("Digite o ID do peer do dowload:")
+        filename = input("Nome do arquivo")
+        save_path = input("Local de destino para dowload")
+        peer.request_file_delta(peer_id, filename, save_path)
+
     elif comando == "arquivos":
         peer_id = input("Digite o ID de quem você que saber os arquivos")
         peer.request_file_list(peer_id)
@@ -57,11 +81,16 @@ while True:
         print("""
             Comandos disponíveis:
             mensagem   - Envia uma mensagem para um peer conectado.
+            todos      - Envia uma mensagem para todos os peers da rede.
+            entrar     - Entra em um grupo de chat.
+            grupo      - Envia uma mensagem para um grupo de chat.
             listar     - Lista os peers conectados.
             conectar   - Conectar aos peers do tracker.
             baixar     - Baixa um arquivo de um peer.
+            sincronizar - Baixa só os trechos alterados de um arquivo (peers com --chunks).
             arquivos   - lista os arquivos de um peer.
             adicionar  - Adiciona arquivo ao peer.
+            compartilhar - Adiciona todos os arquivos de um diretório ao peer.
             buscar     - Buscar os peers que tem o arquivo.
             sair       - Remove o peer do tracker e encerra o programa.
             help       - Mostra esta mensagem de ajuda.
@@ -2,6 +2,8 @@ import socket
 import threading
 import json
 
+from protocol import MessageBuffer
+
 class Tracker:
     def __init__(self, host="0.0.0.0", port=5000):
         """
@@ -15,11 +17,15 @@ class Tracker:
             host (str): O nome do host ou endereço IP ao qual o tracker está vinculado.
             port (int): O número da porta ao qual o tracker está vinculado.
             peers (dict): Um dicionário para armazenar informações dos peers com peer_id como chave.
+            files (dict): Índice de arquivos, com o nome do arquivo como chave e os peers que o possuem como valor.
+            lock (threading.Lock): Protege `peers` e `files`, permitindo aplicar lotes de forma atômica.
             socket (socket.socket): Um objeto socket para comunicação de rede.
         """
         self.host = host
         self.port = port
         self.peers = {}  # {peer_id: {"host": host, "port": port, "conn": conn}}
+        self.files = {}  # {filename: frozenset(peer_id)}
+        self.lock = threading.Lock()
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     def start(self):
@@ -62,6 +68,9 @@ class Tracker:
             - CONNECT: Conecta peers.
             - REMOVE: Remove um peer.
             - ADD_FILE: Adiciona um arquivo à lista do peer.
+            - REMOVE_FILE: Remove um arquivo da lista do peer.
+            - SEARCH: Lista os peers que possuem um arquivo.
+            - BATCH: Aplica várias operações de uma vez e responde com todos os resultados.
 
         Se um comando inválido for recebido, uma resposta de erro é enviada de volta ao peer.
 
@@ -70,32 +79,40 @@ class Tracker:
             Garante que o peer seja removido e a conexão seja fechada em caso de erro.
 
         """
+        buffer = MessageBuffer()
         try:
             while True:
-                data = conn.recv(1024)
+                data = conn.recv(4096)
                 if not data:
                     break
 
-                message = json.loads(data.decode())
-                command = message.get("command")
-
-                if command == "REGISTER":
-                    self.register_peer(conn, message)
-                elif command == "LIST":
-                    self.list_peers(conn)
-                elif command == "CONNECT":
-                    self.connect_peers(conn, message)
-                elif command == "REMOVE":
-                    self.remove_peer(conn, message)
-                elif command == "ADD_FILE":
-                    self.add_file(conn, message)
-
-                else:
-                    self.send_response(conn, {"status": "error", "message": "Comando inválido"})
+                buffer.feed(data)
+                for message in buffer.messages():
+                    command = message.get("command")
+
+                    if command == "REGISTER":
+                        self.register_peer(conn, message)
+                    elif command == "LIST":
+                        self.list_peers(conn)
+                    elif command == "CONNECT":
+                        self.connect_peers(conn, message)
+                    elif command == "REMOVE":
+                        self.remove_peer(conn, message)
+                    elif command == "ADD_FILE":
+                        self.add_file(conn, message)
+                    elif command == "REMOVE_FILE":
+                        self.remove_file(conn, message)
+                    elif command == "SEARCH":
+                        self.search_file(conn, message)
+                    elif command == "BATCH":
+                        self.apply_batch(conn, message)
+
+                    else:
+                        self.send_response(conn, {"status": "error", "message": "Comando inválido"})
         except Exception as e:
             print(f"Erro na comunicação com o peer {addr}: {e}")
         finally:
-            self.remove_peer(addr)
+            self.drop_connection(conn)
             conn.close()
             print(f"Conexão encerrada com {addr}")
 
@@ -116,34 +133,45 @@ class Tracker:
             - Envia uma resposta de sucesso ou erro ao peer.
             - Envia a lista de peers conectados ao peer.
         """
-        peer_id = message.get("peer_id")
-        peer_host = message.get("host")
-        peer_port = message.get("port")
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, message)
 
-        if not peer_id or not peer_host or not peer_port:
-            self.send_response(conn, {"status": "error", "message": "Dados de registro incompletos"})
+        self.send_response(conn, response)
+        if response["status"] != "success":
             return
 
-        self.peers[peer_id] = {"host": peer_host, "port": int(peer_port), "conn": conn}
-        print(f"Peer registrado: {peer_id}, IP: {peer_host}, Porta: {peer_port}")
-
-        self.send_response(conn, {"status": "success", "message": "Registro feito com sucesso"})
+        print(f"Peer registrado: {message['peer_id']}, IP: {message['host']}, Porta: {message['port']}")
 
         # Enviar lista de peers conectados
         self.list_peers(conn)
 
+        self.notify_new_peer(message["peer_id"])
+
+    def notify_new_peer(self, peer_id):
+        """
+        Pede a um peer já registrado que se conecte ao novo peer.
+
+        Args:
+            peer_id (str): Identificador do peer recém-registrado. Se o peer já saiu, nada é feito.
+        """
+        with self.lock:
+            peers = dict(self.peers)  # Cópia: um REMOVE concorrente não afeta a iteração abaixo
+        new_peer = peers.get(peer_id)
+        if new_peer is None:
+            return
+
         # Notificar um peer existente para se conectar ao novo peer
-        existing_peers = list(self.peers.keys())
+        existing_peers = list(peers.keys())
         if len(existing_peers) > 1:  # Se já houver pelo menos 1 peer além do novo
             for existing_peer_id in existing_peers:
                 if existing_peer_id != peer_id:  # Evita escolher o novo peer
-                    existing_peer = self.peers[existing_peer_id]
+                    existing_peer = peers[existing_peer_id]
                     try:
                         print(f"[DEBUG] Notificando {existing_peer_id} para se conectar com {peer_id}")
                         existing_peer["conn"].sendall(json.dumps({
                             "command": "CONNECT",
-                            "target_host": peer_host,
-                            "target_port": peer_port
+                            "target_host": new_peer["host"],
+                            "target_port": new_peer["port"]
                         }).encode())
                         break  # Enviar apenas para um peer
                     except Exception as e:
@@ -162,8 +190,9 @@ class Tracker:
         A resposta contém um dicionário com o status e uma lista de peers.
         Cada peer é representado por um dicionário com suas informações de host e porta.
         """
-        peers_list = {peer_id: {"host": info["host"], "port": info["port"]} for peer_id, info in self.peers.items()}
-        self.send_response(conn, {"status": "success", "peers": peers_list})
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, {"command": "LIST"})
+        self.send_response(conn, response)
 
     def connect_to_peer(self, peer_id, peer_host, peer_port):
         """Estabelece uma conexão com outro peer e mantém a conexão aberta."""
@@ -193,14 +222,12 @@ class Tracker:
         Returns:
             None
         """
-        peer_id = message.get("peer_id")
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, message)
 
-        if peer_id in self.peers:
-            del self.peers[peer_id]
-            print(f"Peer removido: {peer_id}")
-            self.send_response(conn, {"status": "success", "message": f"Peer {peer_id} removido do Tracker"})
-        else:
-            self.send_response(conn, {"status": "error", "message": "Peer não encontrado"})
+        if response["status"] == "success":
+            print(f"Peer removido: {message['peer_id']}")
+        self.send_response(conn, response)
 
     def add_file(self, conn, message):
         """
@@ -210,18 +237,178 @@ class Tracker:
             conn: Conexão do cliente.
             message (dict): Dicionário contendo as informações do peer e o volume de dados compartilhados.
                 - peer_id (str): Identificador do peer.
+                - filename (str, opcional): Nome do arquivo que passa a ser compartilhado pelo peer.
                 - data_shared (int, opcional): Volume de dados compartilhados pelo peer. Padrão é 0.
 
         Responde ao cliente com o status da operação:
             - "success" se o volume de compartilhamento foi atualizado com sucesso.
             - "error" se o peer não foi encontrado.
         """
-        peer_id = message.get("peer_id")
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, message)
+        self.send_response(conn, response)
+
+    def remove_file(self, conn, message):
+        """
+        Remove um arquivo da lista de compartilhamento de um peer.
+
+        Args:
+            conn: Conexão do cliente.
+            message (dict): Dicionário contendo 'peer_id' e 'filename'.
 
-        if peer_id in self.peers:
-            self.send_response(conn, {"status": "success", "message": "Volume de compartilhamento atualizado"})
+        Responde com "error" se o peer ou o arquivo não forem encontrados.
+        """
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, message)
+        self.send_response(conn, response)
+
+    def search_file(self, conn, message):
+        """
+        Envia a lista de peers que compartilham um arquivo.
+
+        Args:
+            conn: Conexão do cliente.
+            message (dict): Dicionário contendo o 'filename' buscado.
+        """
+        with self.lock:
+            response = self.apply_operation(self.peers, self.files, conn, message)
+        self.send_response(conn, response)
+
+    def apply_batch(self, conn, message):
+        """
+        Aplica um lote de operações de forma atômica.
+
+        Args:
+            conn: Conexão do cliente.
+            message (dict): Dicionário com a lista 'operations'. Cada operação tem o mesmo formato
+                de uma mensagem avulsa (REGISTER, LIST, REMOVE, ADD_FILE, REMOVE_FILE ou SEARCH).
+
+        As operações são aplicadas, em ordem, sobre uma cópia do estado do tracker. Se todas
+        tiverem sucesso a cópia substitui o estado; se alguma falhar nada é aplicado. Em ambos
+        os casos o peer recebe uma única resposta com o resultado de cada operação em 'results'.
+        """
+        operations = message.get("operations")
+        if not isinstance(operations, list):
+            self.send_response(conn, {"status": "error", "message": "Lote inválido"})
+            return
+
+        with self.lock:
+            peers, files = dict(self.peers), dict(self.files)
+            results = [self.apply_operation(peers, files, conn, operation) for operation in operations]
+            failed = [i for i, result in enumerate(results) if result["status"] != "success"]
+            if not failed:
+                self.peers, self.files = peers, files
+                # Só notifica registros que continuam valendo ao fim do lote (ex.: REGISTER seguido de REMOVE)
+                registered = [
+                    operation["peer_id"] for operation in operations
+                    if operation.get("command") == "REGISTER" and operation["peer_id"] in peers
+                ]
+
+        if failed:
+            self.send_response(conn, {
+                "status": "error",
+                "message": f"Lote rejeitado: {len(failed)} operação(ões) falharam, nenhuma foi aplicada",
+                "failed": failed,
+                "results": results,
+            })
+            return
+
+        print(f"Lote aplicado: {len(operations)} operações")
+        self.send_response(conn, {"status": "success", "results": results})
+
+        for peer_id in dict.fromkeys(registered):
+            self.notify_new_peer(peer_id)
+
+    def apply_operation(self, peers, files, conn, message):
+        """
+        Aplica uma operação sobre o estado informado e retorna a resposta.
+
+        Args:
+            peers (dict): Estado dos peers a ser alterado.
+            files (dict): Índice de arquivos a ser alterado. Os conjuntos de peers são imutáveis
+                (frozenset) e sempre substituídos, de forma que uma cópia rasa do dicionário
+                basta para isolar um lote do estado publicado.
+            conn: Conexão do peer que enviou a operação.
+            message (dict): A operação.
+
+        Returns:
+            dict: A resposta da operação, com 'status' igual a "success" ou "error".
+        """
+        if not isinstance(message, dict):
+            return {"status": "error", "message": "Operação inválida"}
+
+        command = message.get("command")
+        peer_id = message.get("peer_id")
+        filename = message.get("filename")
+        if not isinstance(peer_id, (str, type(None))) or not isinstance(filename, (str, type(None))):
+            return {"status": "error", "message": "Operação inválida"}
+
+        if command == "REGISTER":
+            peer_host = message.get("host")
+            peer_port = message.get("port")
+            if not peer_id or not peer_host or not peer_port:
+                return {"status": "error", "message": "Dados de registro incompletos"}
+            try:
+                peer_port = int(peer_port)
+            except (TypeError, ValueError):
+                return {"status": "error", "message": "Porta inválida"}
+            peers[peer_id] = {"host": peer_host, "port": peer_port, "conn": conn}
+            return {"status": "success", "message": "Registro feito com sucesso"}
+
+        if command == "LIST":
+            peers_list = {peer_id: {"host": info["host"], "port": info["port"]} for peer_id, info in peers.items()}
+            return {"status": "success", "peers": peers_list}
+
+        if command == "SEARCH":
+            return {"status": "success", "filename": filename, "peers": sorted(files.get(filename, ()))}
+
+        if command not in ("REMOVE", "ADD_FILE", "REMOVE_FILE"):
+            return {"status": "error", "message": "Comando inválido"}
+
+        if peer_id not in peers:
+            return {"status": "error", "message": "Peer não encontrado"}
+
+        if command == "REMOVE":
+            del peers[peer_id]
+            self._forget_files(files, peer_id)
+            return {"status": "success", "message": f"Peer {peer_id} removido do Tracker"}
+
+        if command == "ADD_FILE":
+            if filename:
+                files[filename] = files.get(filename, frozenset()) | {peer_id}
+            return {"status": "success", "message": "Volume de compartilhamento atualizado"}
+
+        owners = files.get(filename, frozenset())
+        if peer_id not in owners:
+            return {"status": "error", "message": "Arquivo não encontrado"}
+        if len(owners) == 1:
+            del files[filename]
         else:
-            self.send_response(conn, {"status": "error", "message": "Peer não encontrado"})
+            files[filename] = owners - {peer_id}
+        return {"status": "success", "message": f"Arquivo {filename} removido"}
+
+    def drop_connection(self, conn):
+        """
+        Remove os peers registrados por uma conexão que foi encerrada.
+
+        Args:
+            conn: A conexão encerrada.
+        """
+        with self.lock:
+            for peer_id, info in list(self.peers.items()):
+                if info["conn"] is conn:
+                    del self.peers[peer_id]
+                    self._forget_files(self.files, peer_id)
+                    print(f"Peer removido: {peer_id}")
+
+    def _forget_files(self, files, peer_id):
+        """Retira um peer de todas as entradas do índice de arquivos."""
+        for filename, owners in list(files.items()):
+            if peer_id in owners:
+                if len(owners) == 1:
+                    del files[filename]
+                else:
+                    files[filename] = owners - {peer_id}
 
     def send_response(self, conn, response):
         """